@@ -2,4 +2,4 @@
 Docstring for src.vcf
 """
 
-from .vcf_to_fasta import VCFtoFASTAPipeline
\ No newline at end of file
+from .vcf_to_fasta import Contig, VCFtoFASTAPipeline
\ No newline at end of file